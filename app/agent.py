@@ -1,13 +1,19 @@
 # app/agent.py
+import asyncio
 import os
-import json
-from typing import Any, Dict, Iterator, List, Optional
+import re
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, DefaultDict, Dict, List, Optional
 import logging
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 
+from app.fast_path import stock_fast_path
+from app.json_compat import dumps, loads
 from app.tools import (
     get_user,
+    get_user_context_msg,
     get_medication_by_name,
     check_stock,
     check_prescription,
@@ -16,7 +22,26 @@ from app.tools import (
 logger = logging.getLogger("pharmacy_agent")
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared HTTP client: pooled keep-alive connections + HTTP/2 multiplexing across requests.
+# Closed in the app lifespan (app/main.py). Timeouts mirror the OpenAI SDK defaults.
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    timeout=httpx.Timeout(600.0, connect=5.0),
+)
+
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+
+# Bounds on concurrent OpenAI streams: a global budget (size to the account's rate limits)
+# and a small per-user cap so one user's burst cannot starve everyone else.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+PER_USER_MAX_CONCURRENCY = 2
+
+_openai_sem = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+# Keyed on validated user_ids only (populated after the User Gate), so it stays bounded
+_user_sems: DefaultDict[str, asyncio.Semaphore] = defaultdict(
+    lambda: asyncio.Semaphore(PER_USER_MAX_CONCURRENCY)
+)
 
 # -----------------------------
 # System prompt
@@ -49,6 +74,10 @@ Tool usage (IMPORTANT):
 - If the medication name is missing or ambiguous, ask a short clarifying question.
 """
 
+# Hoisted so the invariant prompt prefix is byte-stable across requests
+# (lets OpenAI's automatic prompt caching reuse it).
+_SYSTEM_MSG: Dict[str, Any] = {"role": "system", "content": SYSTEM_PROMPT}
+
 # -----------------------------
 # Tool schemas (Responses API)
 # -----------------------------
@@ -88,17 +117,60 @@ TOOLS: List[Dict[str, Any]] = [
     },
 ]
 
+# Constant tool schemas passed via extra_body: the request body is identical, but the SDK
+# skips re-transforming every schema on each call (only needed for strict/pydantic tools).
+_TOOLS_BODY: Dict[str, Any] = {"tools": TOOLS}
+
 # -----------------------------
 # Tool dispatcher
 # -----------------------------
+_TOOL_DISPATCH: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "get_medication_by_name": get_medication_by_name,
+    "check_stock": check_stock,
+    "check_prescription": check_prescription,
+}
+
+
 def _run_tool(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-    if tool_name == "get_medication_by_name":
-        return get_medication_by_name(**args)
-    if tool_name == "check_stock":
-        return check_stock(**args)
-    if tool_name == "check_prescription":
-        return check_prescription(**args)
-    return {"ok": False, "error": {"code": "UNKNOWN_TOOL", "message": f"Tool '{tool_name}' not implemented"}}
+    tool = _TOOL_DISPATCH.get(tool_name)
+    if tool is None:
+        return {"ok": False, "error": {"code": "UNKNOWN_TOOL", "message": f"Tool '{tool_name}' not implemented"}}
+    return tool(**args)
+
+
+async def _run_tool_async(call: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """
+    Execute a single model tool call and return the tool result dict.
+    Tools are in-memory lookups, so they run directly on the event loop;
+    wrap them in asyncio.to_thread if a tool ever does blocking I/O.
+    """
+    name = call.get("name")
+    args = _normalize_args(call.get("arguments"))
+
+    # Ensure user_id always present for check_prescription
+    if name == "check_prescription" and "user_id" not in args:
+        args["user_id"] = user_id
+
+    logger.info("tool_start name=%s args=%s", name, args)
+
+    try:
+        result = _run_tool(name, args)
+        logger.info(
+            "tool_end name=%s ok=%s error_code=%s",
+            name,
+            result.get("ok", result.get("found")),
+            (result.get("error") or {}).get("code"),
+        )
+    except Exception as e:
+        logger.exception("tool_exception name=%s", name)
+        result = {"ok": False, "error": {"code": "TOOL_ERROR", "message": str(e)}}
+
+    return result
+
+
+def _as_dict(item: Any) -> Dict[str, Any]:
+    # SDK output items are pydantic models whose fields live in __dict__ (no copy is made)
+    return item if isinstance(item, dict) else vars(item)
 
 
 def _extract_function_calls(resp: Any) -> List[Dict[str, Any]]:
@@ -115,13 +187,9 @@ def _extract_function_calls(resp: Any) -> List[Dict[str, Any]]:
     if not output:
         return calls
 
-    for item in output:
-        itype = getattr(item, "type", None) if not isinstance(item, dict) else item.get("type")
-        if itype == "function_call":
-            name = getattr(item, "name", None) if not isinstance(item, dict) else item.get("name")
-            arguments = getattr(item, "arguments", None) if not isinstance(item, dict) else item.get("arguments")
-            call_id = getattr(item, "call_id", None) if not isinstance(item, dict) else item.get("call_id")
-            calls.append({"name": name, "arguments": arguments, "call_id": call_id})
+    for item in map(_as_dict, output):
+        if item.get("type") == "function_call":
+            calls.append({"name": item.get("name"), "arguments": item.get("arguments"), "call_id": item.get("call_id")})
 
     return calls
 
@@ -133,28 +201,35 @@ def _normalize_args(arguments: Any) -> Dict[str, Any]:
         return arguments
     if isinstance(arguments, str):
         try:
-            return json.loads(arguments)
+            return loads(arguments)
         except Exception:
             return {}
     return {}
 
 
+# Any codepoint in the Hebrew block (U+0590..U+05FF)
+_HEBREW_RE = re.compile(r"[\u0590-\u05FF]")
+
+
 def _looks_hebrew(text: str) -> bool:
-    for ch in text or "":
-        if "\u0590" <= ch <= "\u05FF":
-            return True
-    return False
+    return bool(text) and _HEBREW_RE.search(text) is not None
 
 
 # -----------------------------
 # Main agent entry (streaming)
 # -----------------------------
-def stream_agent_reply(user_id: str, user_message: str) -> Iterator[str]:
+async def stream_agent_reply(user_id: str, user_message: str) -> AsyncIterator[str]:
     """
     Stateless streaming agent with a mandatory User Gate:
     1) get_user(user_id) ALWAYS runs first
     2) if unknown user -> respond & stop
-    3) else use GPT-5 with tool-calling for medication flows
+    3) simple stock question for a non-prescription medication -> deterministic
+       check_stock answer, no model call (app/fast_path.py)
+    4) else one streaming GPT-5 call with tools: text is streamed as it arrives;
+       if there are no tool calls, stop
+    5) run the requested tools; if a medication is NOT_FOUND -> deterministic message & stop
+    6) else stream the final answer from a second call chained via previous_response_id,
+       sending only the tool outputs
     """
 
     logger.info("chat_request user_id=%s message=%r", user_id, user_message)
@@ -172,118 +247,116 @@ def stream_agent_reply(user_id: str, user_message: str) -> Iterator[str]:
     else:
         logger.info("user_ok user_id=%s name=%s", user_id, user_res["user"].get("name"))
 
+    # ---- Step 0.5: deterministic answer for simple stock questions (no model call) ----
+    fast_answer = stock_fast_path(user_message)
+    if fast_answer is not None:
+        yield fast_answer
+        return
+
     # ---- Step 1: build base input ----
+    # Invariant system prompt first, per-user context after it (maximizes the cacheable prefix)
     base_input: List[Dict[str, Any]] = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "system", "content": f"User context: user_id={user_id}, name={user_res['user'].get('name')}, prescriptions={user_res['user'].get('prescriptions', [])}"},
+        _SYSTEM_MSG,
+        get_user_context_msg(user_res["user"]["user_id"]),
         {"role": "user", "content": user_message},
     ]
 
-    # ---- Step 2: non-streaming call to decide tool usage ----
-    resp = client.responses.create(
-        model="gpt-5",
-        input=base_input,
-        tools=TOOLS,
-        tool_choice="auto",
-    )
-
-    tool_calls = _extract_function_calls(resp)
-    
-    logger.info(
-        "model_tool_calls count=%d calls=%s",
-        len(tool_calls),
-        [{"name": c.get("name"), "arguments": c.get("arguments")} for c in tool_calls],
-    )
-
-
-    # ---- Step 3: if no tools, stream direct answer ----
-    if not tool_calls:
-        with client.responses.stream(model="gpt-5", input=base_input) as stream:
-            for event in stream:
-                if event.type == "response.output_text.delta":
+    # ---- Step 2: single streaming call ----
+    # Text deltas are forwarded as they arrive (tool-less turns need no second call) until the
+    # model starts a function call; function calls are read from the final response.
+    user_sem = _user_sems[user_res["user"]["user_id"]]
+    text_sent = False
+    tool_turn = False
+
+    # Both concurrency slots are held for the whole model section (both calls + the
+    # microsecond tool step), so a request never re-queues behind newer ones mid-turn.
+    async with user_sem, _openai_sem:
+        async with client.responses.stream(
+            model="gpt-5",
+            input=base_input,
+            extra_body=_TOOLS_BODY,
+            tool_choice="auto",
+        ) as stream:
+            async for event in stream:
+                if event.type == "response.output_item.added" and getattr(event.item, "type", None) == "function_call":
+                    tool_turn = True
+                if event.type == "response.output_text.delta" and not tool_turn:
+                    text_sent = True
                     yield event.delta
                 if event.type == "response.error":
                     yield "\nSorry — I encountered an error while generating the response."
                     return
-        return
-
-    # ---- Step 4: execute tools and build outputs ----
+            resp = await stream.get_final_response()
 
-    tool_outputs: List[Dict[str, Any]] = []
-    for call in tool_calls:
-        name = call.get("name")
-        args = _normalize_args(call.get("arguments"))
+        tool_calls = _extract_function_calls(resp)
 
-        # Ensure user_id always present for check_prescription
-        if name == "check_prescription" and "user_id" not in args:
-            args["user_id"] = user_id
-
-        logger.info("tool_start name=%s args=%s", name, args)
-
-        try:
-            result = _run_tool(name, args)
+        if logger.isEnabledFor(logging.INFO):
             logger.info(
-                "tool_end name=%s ok=%s error_code=%s",
-                name,
-                result.get("ok", result.get("found")),
-                (result.get("error") or {}).get("code"),
+                "model_tool_calls count=%d calls=%s",
+                len(tool_calls),
+                [{"name": c.get("name"), "arguments": c.get("arguments")} for c in tool_calls],
             )
-        except Exception as e:
-            logger.exception("tool_exception name=%s", name)
-            result = {"ok": False, "error": {"code": "TOOL_ERROR", "message": str(e)}}
-
-        tool_outputs.append(
-            {
-                "type": "function_call_output",
-                "call_id": call.get("call_id"),
-                "output": json.dumps(result),
-            }
-        )
 
-      # If medication is not found in internal DB — return deterministic message (no model call)
-    for out in tool_outputs:
-        try:
-            result = json.loads(out.get("output", "{}"))
-        except Exception:
-            continue
-
-        if result.get("error", {}).get("code") == "NOT_FOUND":
-            if _looks_hebrew(user_message):
-                yield (
-                    "מצטער/ת, לא מצאתי את שם התרופה במאגר הפנימי של בית המרקחת, "
-                    "ולכן אינני יכול/ה לספק מידע עליה. "
-                    "אם תרצה/י, אפשר לבדוק שוב עם איות מדויק (ובאנגלית אם יש), או לציין שם מסחרי."
-                )
-            else:
-                yield (
-                    "Sorry — I couldn’t find that medication in our internal pharmacy database, "
-                    "so I can’t provide information about it. "
-                    "If you’d like, please confirm the exact spelling (and the generic/brand name)."
-                )
+        # ---- Step 3: if no tools, the direct answer was already streamed ----
+        if not tool_calls:
             return
-    
-    logger.info("flow_summary user_id=%s tools_used=%s", user_id, [c.get("name") for c in tool_calls])
 
+        # Keep any preamble streamed before the function call apart from what follows
+        if text_sent:
+            yield "\n\n"
 
-    # ---- Step 5: stream final answer with tool context ----
-    resp_output = getattr(resp, "output", None)
-    if resp_output is None and isinstance(resp, dict):
-        resp_output = resp.get("output")
+        # ---- Step 4: execute tools and build outputs ----
 
-    if not resp_output:
-        yield "\nSorry — internal error: missing tool call context."
-        return
+        # gather is in place for future async / to_thread tools; today's tools are synchronous
+        # in-memory lookups that never await, so they run one after another (no overlap)
+        results: List[Dict[str, Any]] = await asyncio.gather(
+            *[_run_tool_async(call, user_id) for call in tool_calls]
+        )
 
-    final_input: List[Dict[str, Any]] = []
-    final_input.extend(base_input)
-    final_input.extend(resp_output)      # includes the function_call items with call_id
-    final_input.extend(tool_outputs)     # outputs referencing those call_id's
-
-    with client.responses.stream(model="gpt-5", input=final_input, tools=TOOLS, tool_choice="none", 
-) as stream:
-        for event in stream:
-            if event.type == "response.output_text.delta":
-                yield event.delta
-            if event.type == "response.error":
-                yield "\nSorry — I encountered an error while generating the response."
+        # If medication is not found in internal DB — return deterministic message (no model call).
+        # Checked on the result dicts, so nothing is serialized or re-parsed on this path.
+        for result in results:
+            if (result.get("error") or {}).get("code") == "NOT_FOUND":
+                if _looks_hebrew(user_message):
+                    yield (
+                        "מצטער/ת, לא מצאתי את שם התרופה במאגר הפנימי של בית המרקחת, "
+                        "ולכן אינני יכול/ה לספק מידע עליה. "
+                        "אם תרצה/י, אפשר לבדוק שוב עם איות מדויק (ובאנגלית אם יש), או לציין שם מסחרי."
+                    )
+                else:
+                    yield (
+                        "Sorry — I couldn’t find that medication in our internal pharmacy database, "
+                        "so I can’t provide information about it. "
+                        "If you’d like, please confirm the exact spelling (and the generic/brand name)."
+                    )
                 return
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("flow_summary user_id=%s tools_used=%s", user_id, [c.get("name") for c in tool_calls])
+
+        # Serialize only the outputs that are actually sent back to the model
+        tool_outputs: List[Dict[str, Any]] = [
+            {
+                "type": "function_call_output",
+                "call_id": call.get("call_id"),
+                "output": dumps(result),
+            }
+            for call, result in zip(tool_calls, results)
+        ]
+
+        # ---- Step 5: stream final answer with tool context ----
+        # Chain onto the first response server-side: only the new tool outputs are sent
+        # (the prompt and function_call items are already held by previous_response_id).
+        async with client.responses.stream(
+            model="gpt-5",
+            previous_response_id=resp.id,
+            input=tool_outputs,
+            extra_body=_TOOLS_BODY,
+            tool_choice="none",
+        ) as stream:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                if event.type == "response.error":
+                    yield "\nSorry — I encountered an error while generating the response."
+                    return
@@ -1,4 +1,5 @@
 # app/db.py
+from functools import lru_cache
 
 USERS = [
     {
@@ -162,3 +163,53 @@ MEDICATIONS = [
         "stock": 6,
     },
 ]
+
+
+@lru_cache(maxsize=512)
+def normalize_name(name: str) -> str:
+    """Lookup key for names: trimmed and Unicode case-folded (used for index build and lookup)."""
+    return name.strip().casefold()
+
+
+def _precompute() -> None:
+    """
+    Attach precomputed per-record data (run once at import time; treat as read-only).
+    "_response" is the shared payload returned by get_user / get_medication_by_name.
+    """
+    for u in USERS:
+        # Normalized prescription set (used by check_prescription)
+        u["_presc_normalized"] = frozenset(normalize_name(p) for p in u.get("prescriptions", []))
+        # Per-user context message for the agent prompt (constant per user)
+        u["_ctx_msg"] = {
+            "role": "system",
+            "content": f"User context: user_id={u['user_id']}, name={u['name']}, prescriptions={u['prescriptions']}",
+        }
+        u["_response"] = {
+            "found": True,
+            "user": {
+                "user_id": u.get("user_id"),
+                "name": u.get("name"),
+                "prescriptions": list(u.get("prescriptions", [])),
+            },
+        }
+
+    for m in MEDICATIONS:
+        m["_response"] = {
+            "found": True,
+            "medication": {
+                "name": m.get("name"),
+                "active_ingredient": m.get("active_ingredient"),
+                "requires_prescription": bool(m.get("requires_prescription")),
+                "dosage_instruction": dict(m.get("dosage_instruction", {})),
+                "usage_instructions": m.get("usage_instructions"),
+                "safety_instructions": m.get("safety_instructions"),
+                "stock": m.get("stock"),
+            },
+        }
+
+
+_precompute()
+
+# Lookup indexes built once at import time (O(1) lookups in app/tools.py)
+USERS_BY_ID = {u["user_id"]: u for u in USERS}
+MEDICATIONS_BY_NORMALIZED_NAME = {normalize_name(m["name"]): m for m in MEDICATIONS}
@@ -0,0 +1,50 @@
+# app/fast_path.py
+import logging
+import re
+from typing import Optional
+
+from app.tools import check_stock, get_medication_by_name
+
+logger = logging.getLogger("pharmacy_agent")
+
+# -----------------------------
+# Deterministic stock fast path (no model call)
+# -----------------------------
+_MED = r"(?P<med>[a-z][a-z0-9\- ]*?)"
+
+# Simple English stock questions, matched against the whole message (trailing punctuation stripped)
+_STOCK_QUERY_RES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        rf"how (?:much|many)\s+(?:units of\s+)?{_MED}\s+(?:do you have\s+|is there\s+|are there\s+|is\s+|are\s+)?(?:in stock|left)",
+        rf"(?:what(?:'s| is)\s+(?:the\s+)?)?stock (?:of|for)\s+{_MED}",
+        rf"do you have\s+(?:any\s+)?{_MED}(?:\s+in stock)?",
+        rf"is\s+{_MED}\s+(?:in stock|available)",
+    )
+]
+
+
+def stock_fast_path(user_message: str) -> Optional[str]:
+    """
+    Answer simple stock questions ("do you have X", "stock of X", ...) directly from check_stock.
+    Returns None (fall back to the model) if the message doesn't match, the medication isn't found,
+    or it requires a prescription — so misspellings, translations, NOT_FOUND handling and the
+    prescription note stay with the regular flow.
+    """
+    msg = (user_message or "").strip().rstrip("?!. ")
+    for rx in _STOCK_QUERY_RES:
+        m = rx.fullmatch(msg)
+        if m:
+            break
+    else:
+        return None
+
+    med = get_medication_by_name(m.group("med"))
+    if not med.get("found") or med["medication"]["requires_prescription"]:
+        return None
+
+    result = check_stock(med["medication"]["name"])
+    logger.info("fast_path tool=check_stock name=%s stock=%s", result["name"], result["stock"])
+    if result["stock"] > 0:
+        return f"{result['name']} is in stock ({result['stock']} units available)."
+    return f"{result['name']} is currently out of stock."
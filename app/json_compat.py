@@ -0,0 +1,19 @@
+# app/json_compat.py
+from typing import Any
+
+# Use orjson (C extension) when available; fall back to the stdlib json module.
+try:
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+
+except ImportError:
+    import json
+
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj)
+
+    loads = json.loads
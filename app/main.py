@@ -1,11 +1,37 @@
+import asyncio
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.agent import stream_agent_reply
+from app.agent import http_client, stream_agent_reply
 import logging
 
-app = FastAPI(title="Pharmacy Agent")
-logging.basicConfig(level=logging.INFO)
+# Log records are enqueued by request handlers and written to stderr by a
+# background listener thread, so log I/O never blocks the event loop.
+_log_queue: SimpleQueue = SimpleQueue()
+# (basicConfig's formatter is applied by the QueueHandler before enqueueing.)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_listener.start()
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        _log_listener.stop()
+
+
+app = FastAPI(title="Pharmacy Agent", lifespan=lifespan)
+
+# Seconds without a model token before an SSE keepalive comment is sent
+KEEPALIVE_INTERVAL_S = 1.0
 
 @app.get("/health")
 def health():
@@ -17,10 +43,50 @@ class ChatRequest(BaseModel):
     message: str
 
 
+def _sse_data(chunk: str) -> str:
+    # One SSE event per chunk; multi-line chunks become multiple "data:" lines
+    return "".join(f"data: {line}\n" for line in chunk.split("\n")) + "\n"
+
+
+async def _sse_with_keepalive(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Forward agent chunks as SSE events, emitting a ": keepalive" comment whenever
+    no chunk arrives within KEEPALIVE_INTERVAL_S (e.g. while the model is thinking).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce() -> None:
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL_S)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is done:
+                break
+            if item:
+                yield _sse_data(item)
+        # Re-raise any error from the agent stream
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
 @app.post("/chat")
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     # Stateless: no conversation state is stored server-side
     return StreamingResponse(
-        stream_agent_reply(req.user_id, req.message),
-        media_type="text/plain"
+        _sse_with_keepalive(stream_agent_reply(req.user_id, req.message)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
     )
@@ -1,25 +1,17 @@
 from typing import Optional, Dict, Any
-from app.db import MEDICATIONS, USERS
+from app.db import MEDICATIONS_BY_NORMALIZED_NAME, USERS_BY_ID, normalize_name
 
 # function for internal use only
 def _find_med_by_name(name: str) -> Optional[Dict[str, Any]]:
     if not name:
         return None
-    name_l = name.strip().lower()
-    for m in MEDICATIONS:
-        if m["name"].lower() == name_l:
-            return m
-    return None
+    return MEDICATIONS_BY_NORMALIZED_NAME.get(normalize_name(name))
 
 # function for internal use only
 def _find_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     if not user_id:
         return None
-    uid = user_id.strip()
-    for u in USERS:
-        if u.get("user_id") == uid:
-            return u
-    return None
+    return USERS_BY_ID.get(user_id.strip())
 
 
 def get_user(user_id: str) -> Dict[str, Any]:
@@ -45,15 +37,17 @@ def get_user(user_id: str) -> Dict[str, Any]:
             "error": {"code": "UNKNOWN_USER", "message": f"User '{user_id}' not found"},
         }
 
-    # Return a sanitized copy
-    return {
-        "found": True,
-        "user": {
-            "user_id": user.get("user_id"),
-            "name": user.get("name"),
-            "prescriptions": list(user.get("prescriptions", [])),
-        },
-    }
+    # Sanitized payload precomputed in app/db.py (shared; do not mutate)
+    return user["_response"]
+
+
+def get_user_context_msg(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Precomputed agent "User context" system message for a known user (None if unknown).
+    Not a model-facing tool; used by the agent to build its prompt.
+    """
+    user = _find_user_by_id(user_id)
+    return user["_ctx_msg"] if user else None
 
 
 def get_medication_by_name(name: str) -> Dict[str, Any]:
@@ -77,17 +71,8 @@ def get_medication_by_name(name: str) -> Dict[str, Any]:
             "found": False,
             "error": {"code": "NOT_FOUND", "message": f"Medication '{name}' not found"},
         }
-    return {"found": True,
-            "medication": {
-                    "name": med.get("name"),
-                    "active_ingredient": med.get("active_ingredient"),
-                    "requires_prescription": bool(med.get("requires_prescription")),
-                    "dosage_instruction": dict(med.get("dosage_instruction", {})),
-                    "usage_instructions": med.get("usage_instructions"),
-                    "safety_instructions": med.get("safety_instructions"),
-                    "stock": med.get("stock"),
-            },
-    }
+    # Payload precomputed in app/db.py (shared; do not mutate)
+    return med["_response"]
 
 def check_stock(name: str) -> Dict[str, Any]:
     """
@@ -161,11 +146,9 @@ def check_prescription(user_id: str, name: str) -> Dict[str, Any]:
 
     canonical_name = med.get("name")
     requires = bool(med.get("requires_prescription"))
-    prescriptions = user.get("prescriptions", [])
 
-    # Compare case-insensitively for robustness
-    presc_set = {str(x).strip().lower() for x in prescriptions}
-    user_has = str(canonical_name).strip().lower() in presc_set
+    # Compare case-insensitively for robustness (set precomputed in app/db.py)
+    user_has = normalize_name(canonical_name) in user["_presc_normalized"]
 
     return {
         "ok": True,
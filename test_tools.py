@@ -1,5 +1,6 @@
 # test_tools.py
 from app.tools import get_user, get_medication_by_name, check_stock, check_prescription
+from app.fast_path import stock_fast_path
 
 
 def run_get_user_tests() -> None:
@@ -78,9 +79,46 @@ def run_check_prescription_tests():
     print("\n[6] Case/space robustness (u001, '  aMoXiCiLlIn  ') => requires True, user_has True")
     print(check_prescription("u001", "  aMoXiCiLlIn  "))
 
+def run_stock_fast_path_tests():
+    print("\n=== stock_fast_path tests ===")
+
+    print("\n[1] Trailing '?' 'Do you have Ibuprofen?' => Ibuprofen in stock (18)")
+    print(stock_fast_path("Do you have Ibuprofen?"))
+
+    print("\n[2] 'do you have any paracetamol in stock' => Paracetamol in stock (42)")
+    print(stock_fast_path("do you have any paracetamol in stock"))
+
+    print("\n[3] Count question 'how much paracetamol is left' => Paracetamol in stock (42)")
+    print(stock_fast_path("how much paracetamol is left"))
+
+    print("\n[4] Out of stock 'stock of Cetirizine' => Cetirizine out of stock")
+    print(stock_fast_path("stock of Cetirizine"))
+
+    print("\n[5] 'Is cetirizine available?' => Cetirizine out of stock")
+    print(stock_fast_path("Is cetirizine available?"))
+
+    print("\n[6] Prescription-only 'Do you have Amoxicillin?' => None (model flow)")
+    print(stock_fast_path("Do you have Amoxicillin?"))
+
+    print("\n[7] Strength suffix 'do you have paracetamol 200mg' => None (model flow)")
+    print(stock_fast_path("do you have paracetamol 200mg"))
+
+    print("\n[8] Pronoun 'do you have it?' => None (model flow)")
+    print(stock_fast_path("do you have it?"))
+
+    print("\n[9] Multi-sentence 'Hi. Do you have ibuprofen?' => None (model flow)")
+    print(stock_fast_path("Hi. Do you have ibuprofen?"))
+
+    print("\n[10] Unknown medication 'stock of DoesNotExist' => None (model flow)")
+    print(stock_fast_path("stock of DoesNotExist"))
+
+    print("\n[11] Not a stock question 'what is paracetamol' => None (model flow)")
+    print(stock_fast_path("what is paracetamol"))
+
 
 if __name__ == "__main__":
     run_get_user_tests()
     run_get_medication_by_name_tests()
     run_check_stock_tests()
     run_check_prescription_tests()
+    run_stock_fast_path_tests()